@@ -7,63 +7,79 @@ The generated data is then used to train a neural network, which predicts future
 @author: Tomas Arzola Röber
 """
 
+import os
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import pandas as pd
 from scipy.integrate import odeint
+from numba import njit, prange
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense
-
-# Define the Lorenz system differential equations
-def lorenz(z, t, sigma=10, rho=28, beta=8/3):
-    x, y, z = z
-    dxdt = sigma * (y - x)
-    dydt = x * (rho - z) - y
-    dzdt = x * y - beta * z
-    return [dxdt, dydt, dzdt]
+from tensorflow.keras.optimizers import Adam
+
+# Define the Lorenz system differential equations (compiled, since odeint calls it at every step)
+@njit(fastmath=True, cache=True)
+def lorenz(z, t, sigma=10.0, rho=28.0, beta=8/3):
+    dzdt = np.empty(3)
+    dzdt[0] = sigma * (z[1] - z[0])
+    dzdt[1] = z[0] * (rho - z[2]) - z[1]
+    dzdt[2] = z[0] * z[1] - beta * z[2]
+    return dzdt
+
+# Fixed-step fourth-order Runge-Kutta integration of a batch of trajectories on the uniform time grid t,
+# one row of initial conditions per trajectory, run in parallel over the trajectories
+@njit(parallel=True, fastmath=True, cache=True)
+def rk4_lorenz(initial_conditions, t):
+    dt = t[1] - t[0]
+    trajectories = np.empty((initial_conditions.shape[0], t.size, 3))
+    for n in prange(initial_conditions.shape[0]):
+        z = initial_conditions[n].copy()
+        trajectories[n, 0] = z
+        for i in range(1, t.size):
+            k1 = lorenz(z, t[i - 1])
+            k2 = lorenz(z + dt / 2 * k1, t[i - 1] + dt / 2)
+            k3 = lorenz(z + dt / 2 * k2, t[i - 1] + dt / 2)
+            k4 = lorenz(z + dt * k3, t[i])
+            z = z + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            trajectories[n, i] = z
+    return trajectories
+
+# Define the file path (a plain .npy file, so it can be memory-mapped when loaded)
+data_file = 'lorenz_data.npy'
+
+# Function to generate data
+def generate_lorenz_data(t, seed=0):
+    # Generate 100 trajectories with random initial conditions for (x, y, z)
+    num_trajectories = 100
+    rng = np.random.default_rng(seed)
+    initial_conditions = rng.uniform(low=[-20, -30, 0], high=[20, 30, 50], size=(num_trajectories, 3))
+
+    # Integrate them into one (trajectory, time, variable) array
+    trajectories = rk4_lorenz(initial_conditions, t)
+
+    # Save the data
+    np.save(data_file, trajectories)
+    return trajectories
 
 # Define the time array
 t = np.linspace(0, 25, 10000)  # Simulation time
 
-# Initialize lists to store results
-X_inputs = []
-Y_inputs = []
-Z_inputs = []
-X_outputs = []
-Y_outputs = []
-Z_outputs = []
-
-# Generate 100 trajectories with random initial conditions
-for i in range(100):
-    x0 = np.random.uniform(-20, 20)  # Random initial condition for x
-    y0 = np.random.uniform(-30, 30)  # Random initial condition for y
-    z0 = np.random.uniform(0, 50)    # Random initial condition for z
-    initial_conditions = [x0, y0, z0]
-    
-    # Integrate the differential equations
-    solution = odeint(lorenz, initial_conditions, t)
-    
-    # Store input and output data in lists of lists
-    X_inputs.append(solution[:-1, 0].tolist())  # X values from t=0 to t=9999
-    Y_inputs.append(solution[:-1, 1].tolist())  # Y values from t=0 to t=9999
-    Z_inputs.append(solution[:-1, 2].tolist())  # Z values from t=0 to t=9999
-    X_outputs.append(solution[1:, 0].tolist())  # X values from t=1 to t=10000
-    Y_outputs.append(solution[1:, 1].tolist())  # Y values from t=1 to t=10000
-    Z_outputs.append(solution[1:, 2].tolist())  # Z values from t=1 to t=10000
-
-# Convert lists to NumPy arrays
-X_inputs = np.array(X_inputs)
-Y_inputs = np.array(Y_inputs)
-Z_inputs = np.array(Z_inputs)
-X_outputs = np.array(X_outputs)
-Y_outputs = np.array(Y_outputs)
-Z_outputs = np.array(Z_outputs)
+# Check if data exists, only the trajectories that are indexed later are read from disk
+if os.path.exists(data_file):
+    trajectories = np.load(data_file, mmap_mode='r')
+else:
+    trajectories = generate_lorenz_data(t)
+
+# Inputs and outputs are views into the trajectories, no copies are made
+inputs = trajectories[:, :-1]  # States from t=0 to t=9999
+outputs = trajectories[:, 1:]  # States from t=1 to t=10000
 
 # Determine the number of samples
-num_samples = X_inputs.shape[0]
+num_samples = trajectories.shape[0]
 
 # Create indices for splitting
 indices = np.arange(num_samples)
@@ -76,71 +92,48 @@ split_index = int(0.8 * num_samples)
 train_indices = indices[:split_index]
 test_indices = indices[split_index:]
 
-# Prepare training and testing data
-X_inputs_train = X_inputs[train_indices]
-Y_inputs_train = Y_inputs[train_indices]
-Z_inputs_train = Z_inputs[train_indices]
-X_outputs_train = X_outputs[train_indices]
-Y_outputs_train = Y_outputs[train_indices]
-Z_outputs_train = Z_outputs[train_indices]
-
-X_inputs_test = X_inputs[test_indices]
-Y_inputs_test = Y_inputs[test_indices]
-Z_inputs_test = Z_inputs[test_indices]
-X_outputs_test = X_outputs[test_indices]
-Y_outputs_test = Y_outputs[test_indices]
-Z_outputs_test = Z_outputs[test_indices]
+# Prepare training and testing data, indexing whole trajectories (one copy per split)
+inputs_train = inputs[train_indices]
+outputs_train = outputs[train_indices]
+inputs_test = inputs[test_indices]
+outputs_test = outputs[test_indices]
+
+X_inputs_train, Y_inputs_train = inputs_train[..., 0], inputs_train[..., 1]
+X_inputs_test, Y_inputs_test = inputs_test[..., 0], inputs_test[..., 1]
 
 # Create the phase line diagrams
 fig, axs = plt.subplots(1, 2, figsize=(14, 6))
 
 # Training trajectories
 axs[0].set_title('Training Trajectories')
-for x, y, z in zip(X_inputs_train, Y_inputs_train, Z_inputs_train):
-    axs[0].plot(x, y, 'b-', alpha=0.6)  # Blue for training trajectories
+axs[0].add_collection(LineCollection(inputs_train[..., :2], colors='b', alpha=0.6))  # Blue for training trajectories
+axs[0].autoscale()
 axs[0].scatter(X_inputs_train[:, 0], Y_inputs_train[:, 0], c='red', marker='o', edgecolor='black')
 axs[0].set_xlabel('X')
 axs[0].set_ylabel('Y')
-axs[0].legend()
 axs[0].grid(True)
 
 # Testing trajectories
 axs[1].set_title('Testing Trajectories')
-for x, y, z in zip(X_inputs_test, Y_inputs_test, Z_inputs_test):
-    axs[1].plot(x, y, 'g-', alpha=0.6)  # Green for testing trajectories
+axs[1].add_collection(LineCollection(inputs_test[..., :2], colors='g', alpha=0.6))  # Green for testing trajectories
+axs[1].autoscale()
 axs[1].scatter(X_inputs_test[:, 0], Y_inputs_test[:, 0], c='red', marker='o', edgecolor='black')
 axs[1].set_xlabel('X')
 axs[1].set_ylabel('Y')
-axs[1].legend()
 axs[1].grid(True)
 
 plt.tight_layout()
 plt.show()
 
-# Flatten the data for training
-X_inputs_train = np.array(X_inputs_train).flatten()
-Y_inputs_train = np.array(Y_inputs_train).flatten()
-Z_inputs_train = np.array(Z_inputs_train).flatten()
-X_outputs_train = np.array(X_outputs_train).flatten()
-Y_outputs_train = np.array(Y_outputs_train).flatten()
-Z_outputs_train = np.array(Z_outputs_train).flatten()
-
-X_inputs_test = np.array(X_inputs_test).flatten()
-Y_inputs_test = np.array(Y_inputs_test).flatten()
-Z_inputs_test = np.array(Z_inputs_test).flatten()
-X_outputs_test = np.array(X_outputs_test).flatten()
-Y_outputs_test = np.array(Y_outputs_test).flatten()
-Z_outputs_test = np.array(Z_outputs_test).flatten()
-
-
-
-X_train = np.column_stack((X_inputs_train,Y_inputs_train,Z_inputs_train))
-y_train = np.column_stack((X_outputs_train,Y_outputs_train,Z_outputs_train))
-X_test = np.column_stack((X_inputs_test,Y_inputs_test,Z_inputs_test))
-y_test = np.column_stack((X_outputs_test,Y_outputs_test,Z_outputs_test))
-
-# Convert dataframes to numpy arrays
+# Flatten the trajectories into (sample, variable) rows for training, these reshapes are views
+X_train = inputs_train.reshape(-1, 3)
+y_train = outputs_train.reshape(-1, 3)
+X_test = inputs_test.reshape(-1, 3)
+y_test = outputs_test.reshape(-1, 3)
 
+# Cast the training data once to float32, the dtype the network computes in
+X_train = X_train.astype(np.float32, copy=False)
+y_train = y_train.astype(np.float32, copy=False)
 
 # Define the model
 model = Sequential([
@@ -151,24 +144,49 @@ model = Sequential([
     Dense(3)  # Output layer with 3 units (X, Y, Z)
 ])
 
-# Compile the model
-model.compile(optimizer='adam', loss='mean_squared_error')
+# Use large batches so the tiny network is not dominated by per-step overhead,
+# scaling Adam's default learning rate (tuned for batches of 16) by the square root of the batch ratio
+batch_size = 1024
+learning_rate = 1e-3 * np.sqrt(batch_size / 16)
+
+# Compile the model (jit_compile lets XLA fuse the Dense layers of each training step,
+# steps_per_execution runs several training steps per call into TensorFlow)
+model.compile(optimizer=Adam(learning_rate=learning_rate), loss='mean_squared_error',
+              jit_compile=True, steps_per_execution=16)
+
+# Build the input pipeline, holding out the last 10% of the samples for validation
+num_train = int(0.9 * len(X_train))
+dataset = tf.data.Dataset.from_tensor_slices((X_train, y_train))
+train_dataset = dataset.take(num_train).cache().shuffle(num_train).batch(batch_size).prefetch(tf.data.AUTOTUNE)
+val_dataset = dataset.skip(num_train).batch(batch_size).cache().prefetch(tf.data.AUTOTUNE)
 
 # Train the model
-model.fit(X_train, y_train, epochs=20, batch_size=16, validation_split=0.1)
+model.fit(train_dataset, epochs=20, validation_data=val_dataset)
 
 # Prepare the initial conditions for prediction
 initial_conditions_test = X_test[0].reshape(1, -1)  # Convert the 1D array to 2D
 
+# Autoregressive rollout of the trained network (ReLU hidden layers, linear output layer),
+# compiled with numba and feeding each prediction back as input
+@njit(fastmath=True, cache=True)
+def rollout(initial_state, weights, biases, n_steps):
+    predictions = np.empty((n_steps, initial_state.size))
+    last = initial_state.copy()
+    for i in range(n_steps):
+        hidden = last
+        for k in range(len(weights) - 1):
+            hidden = np.maximum(hidden @ weights[k] + biases[k], 0.0)
+        last = hidden @ weights[-1] + biases[-1]
+        predictions[i] = last
+    return predictions
+
+# Extract the trained weights once as plain NumPy arrays
+weights = tuple(layer.get_weights()[0].astype(np.float64) for layer in model.layers)
+biases = tuple(layer.get_weights()[1].astype(np.float64) for layer in model.layers)
+
 # Make predictions
-last = initial_conditions_test
-predictions = []
-predictions.append(last)
-for time in t:
-    last = model.predict(last)
-    predictions.append(last)
-
-predictions = np.array(predictions).reshape(-1, 3)
+predictions = rollout(initial_conditions_test[0], weights, biases, len(t))
+predictions = np.concatenate([initial_conditions_test, predictions])
 
 predicted_X = []
 predicted_Y = []